@@ -1,21 +1,25 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
 
-from scoring import get_interests, get_score
+from scoring import get_interests_many, get_score
 
 import abc
-import json
+import orjson
 import datetime
 from typing import Optional
 import logging
 import hashlib
-import uuid
+import hmac
+import time
+import os
 from argparse import ArgumentParser
 from http.server import BaseHTTPRequestHandler, HTTPServer
 
 SALT = "Otus"
 ADMIN_LOGIN = "admin"
 ADMIN_SALT = "42"
+SALT_BYTES = SALT.encode('utf-8')
+ADMIN_SALT_BYTES = ADMIN_SALT.encode('utf-8')
 OK = 200
 BAD_REQUEST = 400
 FORBIDDEN = 403
@@ -40,6 +44,27 @@ GENDERS = {
 BIRTHDAY_LIMIT = 70
 
 
+def _is_empty(value):
+    """ Called for falsy values only: None and numbers are not "empty", gender 0 is a valid value """
+    return value is not None and not isinstance(value, (int, float))
+
+
+def _required_error(field):
+    return ValueError(f'The value {type(field).__name__} is required')
+
+
+def _empty_error():
+    return ValueError('The value should not be empty')
+
+
+def _base_check(field, value):
+    """ Required and nullable checks shared by every Field """
+    if field.required and value is None:
+        raise _required_error(field)
+    if not field.nullable and not value and _is_empty(value):
+        raise _empty_error()
+
+
 class Field:
     """ Base class for all Fields. Every field needs an initial value """
     def __init__(self, required: Optional[bool] = False, nullable: Optional[bool] = False) -> None:
@@ -47,87 +72,124 @@ class Field:
         self.nullable = nullable
 
     def validate(self, value):
-        if self.required and value is None:
-            raise ValueError(f'The value {type(self).__name__} is required')
-        if not self.nullable and value in ('', [], (), {}):
-            raise ValueError('The value should not be empty')
+        _base_check(self, value)
+        return self.check(value)
+
+    def check(self, value):
+        """ Type-specific validation, runs after the required/nullable checks """
         return value
 
+    def compile(self):
+        """ validate() with required/nullable resolved once, so calls skip the flag lookups """
+        check = self.check
+        if self.nullable and not self.required:
+            return check
+        if self.nullable:
+            def validate(value):
+                if value is None:
+                    raise _required_error(self)
+                return check(value)
+        elif self.required:
+            def validate(value):
+                if value is None:
+                    raise _required_error(self)
+                if not value and _is_empty(value):
+                    raise _empty_error()
+                return check(value)
+        else:
+            def validate(value):
+                if not value and _is_empty(value):
+                    raise _empty_error()
+                return check(value)
+        return validate
+
 
 class CharField(Field):
-    def validate(self, value):
-        super().validate(value)
+    def check(self, value):
         if not isinstance(value, str):
             raise ValueError('The value should be string')
         return value
 
 
 class ArgumentsField(Field):
-    def validate(self, value):
-        super().validate(value)
+    def check(self, value):
         if not isinstance(value, dict):
             raise ValueError('The value should be dict')
         return value
 
 
 class EmailField(CharField):
-    def validate(self, value):
-        super().validate(value)
+    def check(self, value):
+        if not isinstance(value, str):
+            raise ValueError('The value should be string')
         if '@' not in value:
             raise ValueError('The value should be correct email')
         return value
 
 
 class PhoneField(Field):
-    def validate(self, value):
-        super().validate(value)
-        if not isinstance(value, (str, int)):
+    def check(self, value):
+        if isinstance(value, int):
+            if not 10000000000 <= value <= 99999999999:
+                raise ValueError('The phone number must consist of 11 digits')
+            if value // 10000000000 != 7:
+                raise ValueError('The first digit of number should be 7')
+        elif isinstance(value, str):
+            if len(value) != 11 or not (value.isascii() and value.isdigit()):
+                raise ValueError('The phone number must consist of 11 digits')
+            if value[0] != '7':
+                raise ValueError('The first digit of number should be 7')
+        else:
             raise ValueError('The value should be string or integer')
-        if not str(value)[0] == '7':
-            raise ValueError('The first digit of number should be 7')
-        if len(str(value)) != 11:
-            raise ValueError('The phone number must consist of 11 digits')
         return value
 
 
 class DateField(CharField):
-    def validate(self, value):
-        super().validate(value)
+    def check(self, value):
+        self._parse(value)
+        return value
+
+    def _parse(self, value):
+        """ DD.MM.YYYY string to datetime.date, raises ValueError on anything else """
+        if not isinstance(value, str):
+            raise ValueError('The value should be string')
+        if len(value) != 10 or value[2] != '.' or value[5] != '.':
+            raise ValueError('The value is not in date format DD.MM.YYYY')
         try:
-            datetime.datetime.strptime(value, '%d.%m.%Y')
+            # DD.MM.YYYY -> YYYY-MM-DD, fromisoformat is much cheaper than a generic parser
+            return datetime.date.fromisoformat(value[6:] + '-' + value[3:5] + '-' + value[:2])
         except ValueError:
             raise ValueError('The value is not in date format DD.MM.YYYY')
-        return value
 
 
 class BirthDayField(DateField):
-    def validate(self, value):
-        super().validate(value)
-        birthday = datetime.datetime.strptime(value, '%d.%m.%Y')
-        today = datetime.datetime.now()
-        year_difference = today.year - birthday.year
-        if (today.month, today.day) < (birthday.month, birthday.day):
-            year_difference -= 1  # Hasn't been a birthday in this year
-        if year_difference > BIRTHDAY_LIMIT:
+    def check(self, value):
+        birthday = self._parse(value)
+        today = datetime.date.today()
+        # Anyone born on or before this date is already BIRTHDAY_LIMIT + 1 years old
+        try:
+            limit = today.replace(year=today.year - BIRTHDAY_LIMIT - 1)
+        except ValueError:  # today is Feb 29 and that year is not a leap one
+            limit = today.replace(year=today.year - BIRTHDAY_LIMIT - 1, day=28)
+        if birthday <= limit:
             raise ValueError(f'The birthday should be no older than {BIRTHDAY_LIMIT} years')
         return value
 
 
 class GenderField(Field):
-    def validate(self, value):
-        super().validate(value)
+    def check(self, value):
         if not isinstance(value, int) or value not in GENDERS:
             raise ValueError('Gender takes the values 0, 1 or 2')
         return value
 
 
 class ClientIDsField(Field):
-    def validate(self, value):
-        super().validate(value)
+    def check(self, value):
         if not isinstance(value, list):
             raise ValueError('Data of Client should be list')
+        _type, _int = type, int
         for item in value:
-            if not isinstance(item, int):
+            if _type(item) is not _int:  # bool is an int subclass, but True is not a client id
                 raise ValueError('The Clients_IDs should be a list of digits')
         return value
 
@@ -138,27 +200,39 @@ class MetaRequest(type):
         for key, value in attrs.items():
             if isinstance(value, Field):
                 fields[key] = value
+        for key in fields:
+            del attrs[key]  # replaced by slots below
+        attrs['__slots__'] = tuple(fields)
         attrs['_fields'] = fields
+        for value in fields.values():
+            value._compiled_validate = value.compile()
+        attrs['_field_items'] = tuple(
+            (key, value._compiled_validate, value.required) for key, value in fields.items()
+        )
+        attrs['__init__'] = meta.make_init(fields)
         return type.__new__(meta, name, bases, attrs)
 
+    @staticmethod
+    def make_init(fields):
+        """ Build __init__ that assigns every field directly instead of looping over them """
+        body = ''.join(f'    self.{key} = kwargs.get({key!r})\n' for key in fields)
+        namespace = {}
+        exec('def __init__(self, **kwargs):\n' + (body or '    pass\n'), namespace)
+        return namespace['__init__']
 
-class Request(metaclass=MetaRequest):
-    def __init__(self, **kwargs):
-        for attribute in self._fields:
-            value = kwargs.get(attribute)
-            setattr(self, attribute, value)
 
+class Request(metaclass=MetaRequest):
     def validate(self):
-        for attribute, field in self._fields.items():
-            value = getattr(self, attribute)
-            if value is not None or field.required:
-                field.validate(value)
+        _getattr = getattr  # LOAD_FAST instead of LOAD_GLOBAL inside the loop
+        for attribute, validate, required in self._field_items:
+            value = _getattr(self, attribute, None)
+            if value is not None or required:
+                validate(value)
 
     def __repr__(self):
         attributes = {
-            name: getattr(self, name)
-            for name in self.__dict__
-            if name[0:2] != '__'
+            name: getattr(self, name, None)
+            for name in self._fields
         }
         return f'<Class {self.__class__.__name__}: {attributes}>'
 
@@ -200,19 +274,32 @@ class OnlineScoreRequest(MethodRequest):
             return False
 
 
+_admin_digest = None
+_admin_digest_expires = 0.0
+
+
+def get_admin_digest():
+    """ Admin token changes once an hour, so it is computed only when the hour rolls over """
+    global _admin_digest, _admin_digest_expires
+    if time.time() >= _admin_digest_expires:
+        hour = datetime.datetime.now().replace(minute=0, second=0, microsecond=0)
+        _admin_digest = hashlib.sha512(
+            hour.strftime("%Y%m%d%H").encode('utf-8') + ADMIN_SALT_BYTES
+        ).hexdigest().encode('utf-8')
+        _admin_digest_expires = (hour + datetime.timedelta(hours=1)).timestamp()
+    return _admin_digest
+
+
 def check_auth(request):
     if request.is_admin:
-        digest = hashlib.sha512(
-            (datetime.datetime.now().strftime("%Y%m%d%H")
-                + ADMIN_SALT).encode('utf-8')
-        ).hexdigest()
+        digest = get_admin_digest()
     else:
-        digest = hashlib.sha512(
-            (request.account + request.login + SALT).encode('utf-8')
-        ).hexdigest()
-    if digest == request.token:
-        return True
-    return False
+        sha = hashlib.sha512()
+        sha.update(request.account.encode('utf-8'))
+        sha.update(request.login.encode('utf-8'))
+        sha.update(SALT_BYTES)
+        digest = sha.hexdigest().encode('utf-8')
+    return hmac.compare_digest(digest, request.token.encode('utf-8'))
 
 
 def clients_interests_handler(request, ctx, store):
@@ -225,11 +312,11 @@ def clients_interests_handler(request, ctx, store):
             'error': str(err)
         }, INVALID_REQUEST
 
-    clients_interests = {}
-    for client_id in r.client_ids:
-        clients_interests[f'client_id{client_id}'] = get_interests(
-            'nowhere_store', client_id)
-    return clients_interests, OK
+    interests = get_interests_many(store, r.client_ids)
+    return {
+        'client_id%d' % client_id: client_interests
+        for client_id, client_interests in interests.items()
+    }, OK
 
 
 def online_score_handler(request, ctx, store):
@@ -255,10 +342,13 @@ def online_score_handler(request, ctx, store):
     return {'score': score}, OK
 
 
+METHODS = {
+    'clients_interests': clients_interests_handler,
+    'online_score': online_score_handler,
+}
+
+
 def method_handler(request, ctx, store):
-    response, code = None, None
-    method = {'clients_interests': clients_interests_handler,
-              'online_score': online_score_handler}
     try:
         r = MethodRequest(**request.get('body'))
         r.validate()
@@ -277,8 +367,18 @@ def method_handler(request, ctx, store):
     if not check_auth(r):
         return None, FORBIDDEN
 
-    response, code = method[r.method](r, ctx, store)
-    return response, code
+    handler = METHODS.get(r.method)
+    if handler is None:
+        return {
+            'code': INVALID_REQUEST,
+            'error': 'INVALID_REQUEST: unknown method'
+        }, INVALID_REQUEST
+
+    return handler(r, ctx, store)
+
+
+ERROR_RESPONSES = {code: {"error": message, "code": code} for code, message in ERRORS.items()}
+ERROR_BODIES = {code: orjson.dumps(r) for code, r in ERROR_RESPONSES.items()}
 
 
 class MainHTTPHandler(BaseHTTPRequestHandler):
@@ -286,9 +386,34 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
         "method": method_handler
     }
     store = None
+    _response_heads = {}
+    _date_header = b''
+    _date_header_second = None
+
+    def response_head(self, code):
+        """ Status line, Server and Content-Type headers, encoded once per handler class and code """
+        key = (type(self), self.protocol_version, code)
+        head = self._response_heads.get(key)
+        if head is None:
+            message = self.responses.get(code, ('',))[0]
+            head = (
+                '%s %d %s\r\nServer: %s\r\nContent-Type: application/json\r\n' % (
+                    self.protocol_version, code, message, self.version_string())
+            ).encode('latin-1')
+            self._response_heads[key] = head
+        return head
+
+    def date_header(self):
+        """ Date header line, formatted at most once per second """
+        now = int(time.time())
+        cls = type(self)
+        if now != cls._date_header_second:
+            cls._date_header = ('Date: %s\r\n' % self.date_time_string(now)).encode('latin-1')
+            cls._date_header_second = now
+        return cls._date_header
 
     def get_request_id(self, headers):
-        return headers.get('HTTP_X_REQUEST_ID', uuid.uuid4().hex)
+        return headers.get('HTTP_X_REQUEST_ID') or os.urandom(16).hex()
 
     def do_POST(self):
         response, code = {}, OK
@@ -296,20 +421,22 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
         request = None
         try:
             data_string = self.rfile.read(int(self.headers['Content-Length']))
-            request = json.loads(data_string)
+            request = orjson.loads(data_string)
         except:  # noqa E722
             code = BAD_REQUEST
 
         if request:
             path = self.path.strip("/")
-            logging.info('%s: %s %s' % (
-                self.path,
-                data_string.decode('utf8'),
-                context["request_id"])
-            )
-            if path in self.router:
+            if logging.getLogger().isEnabledFor(logging.INFO):
+                logging.info('%s: %s %s' % (
+                    self.path,
+                    data_string.decode('utf8'),
+                    context["request_id"])
+                )
+            handler = self.router.get(path)
+            if handler is not None:
                 try:
-                    response, code = self.router[path](
+                    response, code = handler(
                         {"body": request, "headers": self.headers},
                         context,
                         self.store
@@ -320,19 +447,24 @@ class MainHTTPHandler(BaseHTTPRequestHandler):
             else:
                 code = NOT_FOUND
 
-        self.send_response(code)
-        self.send_header("Content-Type", "application/json")
-        self.end_headers()
         if code not in ERRORS:
             r = {"response": response, "code": code}
+            body = None
+        elif response:
+            r = {"error": response, "code": code}
+            body = None
         else:
-            r = {
-                "error": response or ERRORS.get(code, "Unknown Error"),
-                "code": code
-            }
+            r = ERROR_RESPONSES[code]
+            body = ERROR_BODIES[code]
         context.update(r)
         logging.info(str(context))
-        self.wfile.write(json.dumps(r).encode())
+        if body is None:
+            body = orjson.dumps(r)
+        self.log_request(code)
+        self.wfile.write(
+            self.response_head(code) + self.date_header()
+            + b'Content-Length: %d\r\n\r\n' % len(body) + body
+        )
         return
 
 
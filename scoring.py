@@ -15,3 +15,7 @@ def get_score(store=None, phone=None, email=None, birthday=None, gender=None, fi
 def get_interests(store, cid):
     interests = ["cars", "pets", "travel", "hi-tech", "sport", "music", "books", "tv", "cinema", "geek", "otus"]
     return random.sample(interests, 2)
+
+def get_interests_many(store, cids):
+    _get = get_interests
+    return {cid: _get(store, cid) for cid in cids}
@@ -2,6 +2,7 @@ import hashlib
 import datetime
 import functools
 import unittest
+from unittest import mock
 
 import api
 
@@ -50,6 +51,7 @@ class TestSuite(unittest.TestCase):
         {"account": "horns&hoofs", "login": "h&f", "method": "online_score"},
         {"account": "horns&hoofs", "login": "h&f", "arguments": {}},
         {"account": "horns&hoofs", "method": "online_score", "arguments": {}},
+        {"account": "horns&hoofs", "login": "h&f", "method": "unknown_method", "arguments": {}},
     ])
     def test_invalid_method_request(self, request):
         self.set_valid_auth(request)
@@ -62,10 +64,18 @@ class TestSuite(unittest.TestCase):
         {"phone": "79175002040"},
         {"phone": "89175002040", "email": "stupnikov@otus.ru"},
         {"phone": "79175002040", "email": "stupnikovotus.ru"},
+        {"phone": "7abcdefghij", "email": "stupnikov@otus.ru"},
+        {"phone": 89175002040, "email": "stupnikov@otus.ru"},
+        {"phone": 7917500204, "email": "stupnikov@otus.ru"},
+        {"phone": 791750020400, "email": "stupnikov@otus.ru"},
+        {"phone": "7\u0669\u0661\u0667\u0665\u0660\u0660\u0662\u0660\u0664\u0660", "email": "stupnikov@otus.ru"},
         {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": -1},
         {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": "1"},
         {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.1890"},
         {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "XXX"},
+        {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "1.1.2000"},
+        {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": " 1.01.2000"},
+        {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "\u0660\u0661.\u0660\u0661.\u0662\u0660\u0660\u0660"},
         {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.2000", "first_name": 1},
         {"phone": "79175002040", "email": "stupnikov@otus.ru", "gender": 1, "birthday": "01.01.2000",
          "first_name": "s", "last_name": 2},
@@ -99,6 +109,43 @@ class TestSuite(unittest.TestCase):
         self.assertTrue(isinstance(score, (int, float)) and score >= 0, arguments)
         self.assertEqual(sorted(self.context["has"]), sorted(arguments.keys()))
 
+    @cases([
+        (datetime.date(2024, 2, 29), "28.02.1953", False),
+        (datetime.date(2024, 2, 29), "01.03.1953", True),
+        (datetime.date(2023, 3, 1), "01.03.1952", False),
+        (datetime.date(2023, 3, 1), "02.03.1952", True),
+    ])
+    def test_birthday_limit(self, today, birthday, valid):
+        class FakeDate(datetime.date):
+            @classmethod
+            def today(cls):
+                return today
+
+        with mock.patch.object(api.datetime, "date", FakeDate):
+            if valid:
+                api.BirthDayField().validate(birthday)
+            else:
+                self.assertRaises(ValueError, api.BirthDayField().validate, birthday)
+
+    @cases([api.CharField, api.ArgumentsField, api.EmailField, api.PhoneField, api.DateField,
+            api.GenderField, api.ClientIDsField])
+    def test_compiled_validate_matches_validate(self, field_class):
+        def outcome(validate, value):
+            try:
+                return "ok", validate(value)
+            except ValueError as err:
+                return "error", str(err)
+
+        values = [None, "", [], {}, (), 0, False, 1, "x", "a@b", "01.01.2000", [1], {"a": 1},
+                  "79175002040", 79175002040]
+        for required in (False, True):
+            for nullable in (False, True):
+                field = field_class(required=required, nullable=nullable)
+                compiled = field.compile()
+                for value in values:
+                    self.assertEqual(outcome(field.validate, value), outcome(compiled, value),
+                                     (field_class.__name__, required, nullable, value))
+
     def test_ok_score_admin_request(self):
         arguments = {"phone": "79175002040", "email": "stupnikov@otus.ru"}
         request = {"account": "horns&hoofs", "login": "admin", "method": "online_score", "arguments": arguments}
@@ -108,13 +155,27 @@ class TestSuite(unittest.TestCase):
         score = response.get("score")
         self.assertEqual(score, 42)
 
+    def test_stale_admin_digest_is_refreshed(self):
+        api.get_admin_digest()
+        api._admin_digest = b"stale"
+        api._admin_digest_expires = 0.0
+        request = {"account": "horns&hoofs", "login": "admin", "method": "online_score", "arguments": {}}
+        self.set_valid_auth(request)
+        response, code = self.get_response(request)
+        self.assertEqual(api.OK, code)
+        self.assertEqual(api.get_admin_digest(), request["token"].encode('utf-8'))
+
     @cases([
         {},
         {"date": "20.07.2017"},
         {"client_ids": [], "date": "20.07.2017"},
         {"client_ids": {1: 2}, "date": "20.07.2017"},
         {"client_ids": ["1", "2"], "date": "20.07.2017"},
+        {"client_ids": [1, 2, True], "date": "20.07.2017"},
         {"client_ids": [1, 2], "date": "XXX"},
+        {"client_ids": [1, 2], "date": "1.1.2000"},
+        {"client_ids": [1, 2], "date": " 1.01.2000"},
+        {"client_ids": [1, 2], "date": "\u0660\u0661.\u0660\u0661.\u0662\u0660\u0660\u0660"},
     ])
     def test_invalid_interests_request(self, arguments):
         request = {"account": "horns&hoofs", "login": "h&f", "method": "clients_interests", "arguments": arguments}